@@ -8,9 +8,13 @@ import argparse
 import logging
 import sys
 
-from src.api import paginate_products
+from src.api import (
+    OpenFoodFactsAPI,
+    download_openfoodfacts_dump,
+    iter_openfoodfacts_dump,
+)
 from src.models import create_database
-from src.process import save_data
+from src.process import save_batches, save_data
 
 
 def setup_logging(verbose: bool = False):
@@ -24,6 +28,17 @@ def setup_logging(verbose: bool = False):
     return logging.getLogger(__name__)
 
 
+def positive_int(value: str) -> int:
+    """Parse a command line value that must be a positive integer"""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value!r}")
+    return number
+
+
 def parse_args():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(
@@ -34,26 +49,50 @@ Examples:
   %(prog)s "coca cola"
   %(prog)s "chocolate cookies" --max-pages 5
   %(prog)s "organic milk" --verbose
+  %(prog)s --dump openfoodfacts-products.jsonl.gz
         """,
     )
 
     parser.add_argument(
         "search_terms",
         type=str,
+        nargs="?",
         help="Search terms to find products (e.g., 'coca cola', 'chocolate')",
     )
 
+    parser.add_argument(
+        "--dump",
+        metavar="PATH",
+        help="Load the full OpenFoodFacts JSONL dump from PATH instead of "
+        "searching (downloaded first if missing)",
+    )
+
     parser.add_argument(
         "--max-pages",
         type=int,
         help="Maximum number of pages to fetch (default: all pages)",
     )
 
+    parser.add_argument(
+        "--batch-size",
+        type=positive_int,
+        default=1000,
+        help="Number of products written per bulk insert (default: 1000)",
+    )
+
     parser.add_argument(
         "--verbose", "-v", action="store_true", help="Enable verbose logging"
     )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.search_terms and not args.dump:
+        parser.error("either search_terms or --dump is required")
+    if args.dump and args.search_terms:
+        parser.error("search_terms cannot be combined with --dump")
+    if args.dump and args.max_pages is not None:
+        parser.error("--max-pages cannot be combined with --dump")
+
+    return args
 
 
 def main():
@@ -67,7 +106,12 @@ def main():
 
     base_url = "https://world.openfoodfacts.org/cgi/search.pl"
 
-    logger.info("Starting Food Facts application for search: '%s'", args.search_terms)
+    if args.dump:
+        logger.info("Starting Food Facts application for dump: '%s'", args.dump)
+    else:
+        logger.info(
+            "Starting Food Facts application for search: '%s'", args.search_terms
+        )
 
     try:
         # Create database and tables
@@ -75,15 +119,23 @@ def main():
         create_database()
         logger.info("Database initialization complete")
 
-        params = {"search_terms": args.search_terms, "json": 1, "search_simple": 1}
-        logger.info("Searching for products with terms: %s", params["search_terms"])
-
-        if args.max_pages:
-            logger.info("Limited to maximum %d pages", args.max_pages)
-
-        products, total_count = paginate_products(base_url, params, args.max_pages)
-        save_data(products, total_count)
-        logger.info("Search complete. Products processed successfully")
+        if args.dump:
+            download_openfoodfacts_dump(args.dump)
+            save_data(iter_openfoodfacts_dump(args.dump), batch_size=args.batch_size)
+            logger.info("Dump load complete. Products processed successfully")
+        else:
+            params = {"search_terms": args.search_terms, "json": 1, "search_simple": 1}
+            logger.info("Searching for products with terms: %s", params["search_terms"])
+
+            if args.max_pages:
+                logger.info("Limited to maximum %d pages", args.max_pages)
+
+            with OpenFoodFactsAPI(base_url) as api:
+                batches, total_count = api.paginate_products_batched(
+                    params, args.max_pages, args.batch_size
+                )
+                save_batches(batches, total_count)
+            logger.info("Search complete. Products processed successfully")
 
     except KeyboardInterrupt:
         logger.info("Process interrupted by user")
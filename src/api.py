@@ -4,79 +4,334 @@ This module provides functionality to interact with the OpenFoodFacts API,
 including pagination, rate limiting, and error handling.
 """
 
+import asyncio
+import gzip
+import itertools
 import logging
-from time import sleep
-from typing import Iterator, Optional, Dict, Any, Tuple
+import math
+import os
+import random
+import shutil
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep
+from urllib.parse import urlencode
+from typing import AsyncIterator, Iterator, List, Optional, Dict, Any, Tuple
 
 import niquests as niq
+import orjson
 from niquests import Response
 
 logger = logging.getLogger(__name__)
 
+# OS-seeded so concurrent workers and processes don't retry in lockstep
+_jitter = random.SystemRandom()
+
+# Rate limiting and transient server errors; any other HTTP error is final
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+# Identifies this client to OpenFoodFacts on every request, as their API asks
+USER_AGENT = "fetch-openfoodfacts/0.1 (your@email.com)"
+
+# Full product export, one JSON document per line
+DUMP_URL = "https://static.openfoodfacts.org/data/openfoodfacts-products.jsonl.gz"
+
+
+def _loads(response: Response) -> Any:
+    """Decode a JSON response body with orjson"""
+    return orjson.loads(response.content)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given as delta-seconds or an HTTP-date"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+    return max(0.0, seconds) if math.isfinite(seconds) else None
+
+
+class RateLimiter:
+    """Token bucket allowing bursts of up to `calls` requests per `period` seconds.
+
+    Callers reserve a slot and sleep for the returned delay themselves, so the
+    same limiter paces both the synchronous and the async request paths. A
+    pause cannot reach callers already sleeping, so they compare `pauses`
+    before and after the sleep and reserve again if it changed.
+    """
+
+    def __init__(self, calls: int, period: float):
+        self.interval = period / calls
+        self.burst = (calls - 1) * self.interval
+        self.pauses = 0  # Bumped by every pause()
+        self._theoretical_arrival = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returning how many seconds to wait before using it"""
+        with self._lock:
+            now = monotonic()
+            arrival = max(self._theoretical_arrival, now)
+            start = max(now, arrival - self.burst)
+            self._theoretical_arrival = arrival + self.interval
+            return start - now
+
+    def pause(self, seconds: float) -> None:
+        """Delay every later reservation by at least `seconds`"""
+        with self._lock:
+            self._theoretical_arrival = max(
+                self._theoretical_arrival, monotonic() + seconds + self.burst
+            )
+            self.pauses += 1
+
 
 class OpenFoodFactsAPI:
     """API client for OpenFoodFacts"""
 
-    def __init__(self, base_url: str = "https://world.openfoodfacts.org/cgi/search.pl"):
+    def __init__(
+        self,
+        base_url: str = "https://world.openfoodfacts.org/cgi/search.pl",
+        concurrency: int = 8,
+    ):
         self.base_url = base_url
-        self.headers = {"User-Agent": "fetch-openfoodfacts/0.1 (your@email.com)"}
+        self.headers = {"User-Agent": USER_AGENT}
         self.page_size = 250
-        self.rate_limit_delay = 0.6  # 100/min = 1 every 0.6s
+        self.timeout = 30.0  # Seconds per request
+        self.concurrency = concurrency  # Max page requests in flight at once
+        self.limiter = RateLimiter(calls=100, period=60.0)  # 100/min
         self.max_retries = 3
         self.base_backoff_delay = 1.0  # Base delay in seconds
         self.max_backoff_delay = 60.0  # Max delay in seconds
 
+        # Persistent session so TCP/TLS connections are reused across pages
+        self.session = niq.Session()
+        self.session.headers.update(self.headers)
+
+    def close(self) -> None:
+        """Close the underlying HTTP session"""
+        self.session.close()
+
+    def __enter__(self) -> "OpenFoodFactsAPI":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Calculate exponential backoff delay with equal jitter for a failed attempt"""
+        backoff_delay = min(
+            self.base_backoff_delay * (2**attempt), self.max_backoff_delay
+        )
+        delay = _jitter.uniform(backoff_delay / 2, backoff_delay)
+
+        logger.debug(
+            "Backoff calculation: attempt=%d, base_delay=%.2fs, backoff_delay=%.2fs, final_delay=%.2fs",
+            attempt,
+            self.base_backoff_delay,
+            backoff_delay,
+            delay,
+        )
+        return delay
+
+    def _wait_for_slot(self) -> None:
+        """Sleep until the rate limit allows a request, honouring later pauses"""
+        while True:
+            pauses = self.limiter.pauses
+            sleep(self.limiter.reserve())
+            if self.limiter.pauses == pauses:
+                return
+
+    async def _wait_for_slot_async(self) -> None:
+        """Async variant of _wait_for_slot"""
+        while True:
+            pauses = self.limiter.pauses
+            await asyncio.sleep(self.limiter.reserve())
+            if self.limiter.pauses == pauses:
+                return
+
+    def _retry_delay(self, attempt: int, error: niq.RequestException) -> Optional[float]:
+        """Return seconds to wait before retrying a failed request, or None to give up"""
+        response = getattr(error, "response", None)
+        status_code = response.status_code if response is not None else None
+
+        # Connection errors and timeouts have no status and are always retried
+        if status_code is not None and status_code not in RETRYABLE_STATUS_CODES:
+            logger.error("Request failed with status %d: %s", status_code, error)
+            return None
+
+        if attempt == self.max_retries:
+            logger.error(
+                "Request failed after %d attempts: %s", self.max_retries + 1, error
+            )
+            return None
+
+        retry_after = None
+        if status_code == 429:
+            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+
+        if retry_after is not None:
+            delay = retry_after
+            # The quota is shared, so hold back every other pending request too
+            self.limiter.pause(delay)
+        else:
+            delay = self._backoff_delay(attempt)
+
+        logger.warning(
+            "Request failed (attempt %d/%d): %s. Retrying in %.2fs",
+            attempt + 1,
+            self.max_retries + 1,
+            error,
+            delay,
+        )
+        return delay
+
     def _make_request_with_retry(self, url: str, params: Optional[Dict[str, Any]] = None) -> Response:
         """Make HTTP request with retry and exponential backoff"""
         last_exception = None
 
         for attempt in range(self.max_retries + 1):
+            self._wait_for_slot()
             try:
-                response = niq.get(url, params=params, headers=self.headers)
+                response = self.session.get(url, params=params, timeout=self.timeout)
                 response.raise_for_status()
                 return response
             except niq.RequestException as e:
                 last_exception = e
 
-                if attempt == self.max_retries:
-                    logger.error(
-                        "Request failed after %d attempts: %s", self.max_retries + 1, e
-                    )
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
                     break
+                sleep(delay)
 
-                # Calculate exponential backoff with jitter
-                backoff_delay = min(
-                    self.base_backoff_delay * (2**attempt), self.max_backoff_delay
-                )
-                delay = backoff_delay
-
-                logger.debug(
-                    "Backoff calculation: attempt=%d, base_delay=%.2fs, backoff_delay=%.2fs, final_delay=%.2fs",
-                    attempt,
-                    self.base_backoff_delay,
-                    backoff_delay,
-                    delay,
-                )
-                logger.warning(
-                    "Request failed (attempt %d/%d): %s. Retrying in %.2fs",
-                    attempt + 1,
-                    self.max_retries + 1,
-                    e,
-                    delay,
+        if last_exception:
+            raise last_exception
+        raise RuntimeError("Should not reach here")
+
+    async def _make_request_with_retry_async(
+        self,
+        session: niq.AsyncSession,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> Response:
+        """Async variant of _make_request_with_retry sharing the same rate limit"""
+        last_exception = None
+
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_slot_async()
+            try:
+                response = await session.get(
+                    url, params=params, timeout=self.timeout
                 )
-                sleep(delay)
+                # Multiplexed responses are lazy; wait for this one to arrive
+                await session.gather(response)
+                response.raise_for_status()
+                return response
+            except niq.RequestException as e:
+                last_exception = e
+
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
 
         if last_exception:
             raise last_exception
         raise RuntimeError("Should not reach here")
 
+    def _page_url_prefix(self, params: Dict[str, Any]) -> str:
+        """Encode the fixed search query once; append a page number to get a URL"""
+        query = urlencode({**params, "page_size": self.page_size}, doseq=True)
+        separator = "&" if "?" in self.base_url else "?"
+        return f"{self.base_url}{separator}{query}&page="
+
+    async def _fetch_page(
+        self,
+        session: niq.AsyncSession,
+        semaphore: asyncio.Semaphore,
+        page_url_prefix: str,
+        page: int,
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """Fetch a single page of products, or none if it cannot be fetched"""
+        async with semaphore:
+            logger.debug(
+                "Fetching page %d with %d items per page", page, self.page_size
+            )
+            try:
+                response = await self._make_request_with_retry_async(
+                    session, f"{page_url_prefix}{page}"
+                )
+                return page, _loads(response)["products"]
+            except (
+                niq.RequestException,
+                orjson.JSONDecodeError,
+                KeyError,
+                ValueError,
+            ) as e:
+                # Skip only this page; the others in flight are still wanted
+                logger.error("Error fetching page %d: %s", page, e)
+                return page, []
+
+    async def _paginate_async(
+        self, params: Dict[str, Any], pages: range
+    ) -> AsyncIterator[Tuple[int, List[Dict[str, Any]]]]:
+        """Fetch pages concurrently, yielding (page, products) as each completes"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        page_url_prefix = self._page_url_prefix(params)
+
+        # Multiplexing lets HTTP/2 carry every in-flight page on one connection;
+        # the pool size only matters if the server falls back to HTTP/1.1
+        async with niq.AsyncSession(
+            headers=self.headers,
+            multiplexed=True,
+            pool_connections=1,
+            pool_maxsize=self.concurrency,
+        ) as session:
+            tasks = [
+                asyncio.ensure_future(
+                    self._fetch_page(session, semaphore, page_url_prefix, page)
+                )
+                for page in pages
+            ]
+            try:
+                # Completion order keeps one slow page from holding back the rest
+                for next_page in asyncio.as_completed(tasks):
+                    yield await next_page
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _iterate_pages(
+        self, params: Dict[str, Any], pages: range
+    ) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """Drive the async page fetcher from synchronous code"""
+        loop = asyncio.new_event_loop()
+        page_iterator = self._paginate_async(params, pages)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(page_iterator.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(page_iterator.aclose())
+            loop.close()
+
     def get_total_count(self, response: Response) -> int:
         """Get total count of products for given search parameters"""
         try:
             response.raise_for_status()
-            data = response.json()
-            return data["count"]
-        except (niq.RequestException, KeyError, ValueError) as e:
+            return _loads(response)["count"]
+        except (niq.RequestException, orjson.JSONDecodeError, KeyError, ValueError) as e:
             logger.error("Error getting total product count: %s", e)
             return 0
 
@@ -84,6 +339,18 @@ class OpenFoodFactsAPI:
         self, params: Dict[str, Any], max_pages: Optional[int] = None
     ) -> Tuple[Iterator[Dict[str, Any]], int]:
         """Returns iterator of products and total count"""
+        batches, total_count = self.paginate_products_batched(params, max_pages)
+        return itertools.chain.from_iterable(batches), total_count
+
+    def paginate_products_batched(
+        self,
+        params: Dict[str, Any],
+        max_pages: Optional[int] = None,
+        batch_size: int = 500,
+    ) -> Tuple[Iterator[List[Dict[str, Any]]], int]:
+        """Returns iterator of product lists of up to batch_size and total count"""
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, got {batch_size}")
         logger.info("Starting product pagination with params: %s", params)
         if max_pages:
             logger.debug("Max pages limit set to: %d", max_pages)
@@ -97,86 +364,139 @@ class OpenFoodFactsAPI:
             initial_response = self._make_request_with_retry(
                 self.base_url, params=initial_params
             )
-            total_count = self.get_total_count(initial_response)
-        except (niq.RequestException, ValueError) as e:
+            # Decode once; the first page's products are reused by the iterator
+            first_page_data = _loads(initial_response)
+            total_count = first_page_data["count"]
+            first_page_products = first_page_data["products"]
+        except (niq.RequestException, orjson.JSONDecodeError, KeyError, ValueError) as e:
             logger.error("Error getting initial product count: %s", e)
             return iter([]), 0
+        # Release the raw body before the remaining pages start arriving
+        del initial_response, first_page_data
 
         logger.info("Found %d total products to fetch", total_count)
 
-        def product_iterator():
-            page = 1
+        # Every page after the first is known up front, so fetch them concurrently
+        total_pages = math.ceil(total_count / self.page_size)
+        last_page = min(total_pages, max_pages) if max_pages else total_pages
+
+        def batch_iterator():
             total_products_yielded = 0
-            first_page_data = initial_response.json()  # Reuse initial response
+            batch: List[Dict[str, Any]] = []
+            remaining_pages = self._iterate_pages(params, range(2, last_page + 1))
 
-            while True:
-                logger.debug(
-                    "Processing page %d with %d items per page", page, self.page_size
-                )
+            try:
+                pages = itertools.chain([(1, first_page_products)], remaining_pages)
 
-                try:
-                    # Use cached first page data, otherwise make API call
-                    if page == 1:
-                        data = first_page_data
-                        page_products = data["products"]
-                    else:
-                        # Add pagination parameters for subsequent pages
-                        current_params = params.copy()
-                        current_params["page"] = page
-                        current_params["page_size"] = self.page_size
-
-                        response = self._make_request_with_retry(
-                            self.base_url, params=current_params
-                        )
-                        data = response.json()
-                        page_products = data["products"]
-
-                    # Yield each product individually
-                    for product in page_products:
-                        yield product
-                        total_products_yielded += 1
+                for page, page_products in pages:
+                    batch.extend(page_products)
+                    total_products_yielded += len(page_products)
 
                     logger.debug(
-                        "Page %d: Retrieved %d products. Total yielded: %d/%d",
+                        "Page %d: Retrieved %d products. Total fetched: %d/%d",
                         page,
                         len(page_products),
                         total_products_yielded,
                         total_count,
                     )
 
-                except (niq.RequestException, KeyError, ValueError) as e:
-                    logger.error("Error fetching page %d: %s", page, e)
-                    break
+                    # Yield full batches, carrying any remainder into the next page
+                    while len(batch) >= batch_size:
+                        yield batch[:batch_size]
+                        batch = batch[batch_size:]
 
-                # Check if we've processed all products on this page
-                if len(page_products) == 0:
-                    logger.debug("No more products to fetch - empty page")
-                    break
+                    # Pages arrive out of order, so an empty one cannot end the loop
+                    if len(page_products) == 0:
+                        logger.debug("Page %d returned no products", page)
 
-                # Check if we've hit our max page limit
-                if max_pages and page >= max_pages:
-                    logger.warning("Reached max page limit: %d", max_pages)
-                    break
+            except (
+                niq.RequestException,
+                orjson.JSONDecodeError,
+                KeyError,
+                ValueError,
+            ) as e:
+                logger.error("Error fetching products: %s", e)
+            finally:
+                remaining_pages.close()
 
-                page += 1
-                logger.debug(
-                    "Waiting %ss before next request (rate limit compliance)",
-                    self.rate_limit_delay,
-                )
-                sleep(self.rate_limit_delay)
+            if batch:
+                yield batch
+
+            if max_pages and total_pages > max_pages:
+                logger.warning("Reached max page limit: %d", max_pages)
 
             logger.debug(
                 "Pagination complete. Total products yielded: %d",
                 total_products_yielded,
             )
 
-        return product_iterator(), total_count
+        return batch_iterator(), total_count
 
 
-# Convenience function for backward compatibility
+def _closing(api: "OpenFoodFactsAPI", iterator: Iterator[Any]) -> Iterator[Any]:
+    """Yield from iterator, then close the API session it reads from"""
+    try:
+        yield from iterator
+    finally:
+        api.close()
+
+
+# Convenience functions for backward compatibility; prefer
+# ``with OpenFoodFactsAPI(base_url) as api:`` so the session lifetime is explicit
 def paginate_products(
     base_url: str, params: Dict[str, Any], max_pages: Optional[int] = None
 ) -> Tuple[Iterator[Dict[str, Any]], int]:
-    """Convenience function that uses OpenFoodFactsAPI class"""
+    """Convenience function that uses OpenFoodFactsAPI class, closing it when done"""
+    api = OpenFoodFactsAPI(base_url)
+    try:
+        iterator, total_count = api.paginate_products(params, max_pages)
+    except BaseException:
+        api.close()
+        raise
+    return _closing(api, iterator), total_count
+
+
+def paginate_products_batched(
+    base_url: str,
+    params: Dict[str, Any],
+    max_pages: Optional[int] = None,
+    batch_size: int = 500,
+) -> Tuple[Iterator[List[Dict[str, Any]]], int]:
+    """Convenience function that uses OpenFoodFactsAPI class, closing it when done"""
     api = OpenFoodFactsAPI(base_url)
-    return api.paginate_products(params, max_pages)
+    try:
+        iterator, total_count = api.paginate_products_batched(
+            params, max_pages, batch_size
+        )
+    except BaseException:
+        api.close()
+        raise
+    return _closing(api, iterator), total_count
+
+
+def download_openfoodfacts_dump(path: str, url: str = DUMP_URL) -> str:
+    """Download the gzipped JSONL dump to path unless it is already there"""
+    if os.path.exists(path):
+        logger.info("Using existing dump at %s", path)
+        return path
+
+    logger.info("Downloading %s to %s", url, path)
+    partial_path = path + ".part"
+    with niq.get(
+        url, headers={"User-Agent": USER_AGENT}, stream=True, timeout=60.0
+    ) as response:
+        response.raise_for_status()
+        with open(partial_path, "wb") as f:
+            shutil.copyfileobj(response.raw, f, 1 << 20)
+
+    # Only expose the file under its final name once it is complete
+    os.replace(partial_path, path)
+    return path
+
+
+def iter_openfoodfacts_dump(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream products from a gzipped JSONL dump, one line at a time"""
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)
@@ -6,10 +6,11 @@ including products, nutrients, ingredients, categories, and countries.
 
 import logging
 import os
-from datetime import datetime, timezone
+from contextlib import contextmanager
 
-from typing import Any, Optional, Type
+from typing import Any, Dict, Iterable, Iterator, Optional, Type, Union
 from sqlalchemy import (
+    BigInteger,
     Column,
     DateTime,
     Float,
@@ -20,7 +21,11 @@ from sqlalchemy import (
     Text,
     create_engine,
     event,
+    func,
+    inspect,
+    select,
 )
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.declarative import declarative_base, DeclarativeMeta
 from sqlalchemy.orm import relationship, sessionmaker, Session
 
@@ -29,21 +34,24 @@ logger = logging.getLogger(__name__)
 _Base = declarative_base()
 Base: Type[Any] = _Base
 
+# Primary and foreign keys: INTEGER on SQLite so primary keys alias the rowid,
+# BIGINT elsewhere, always the same type on both sides of a foreign key
+IdType = BigInteger().with_variant(Integer, "sqlite")
+
 
 class AuditMixin:
     """Base class with audit fields for all tables.
 
     Provides created_at and updated_at timestamp fields that are automatically
-    managed for all models that inherit from this mixin.
+    managed for all models that inherit from this mixin. Defaults are computed
+    by the database, so bulk inserts may omit these columns entirely.
     """
 
-    created_at = Column(
-        DateTime, default=lambda: datetime.now(timezone.utc), nullable=False
-    )
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
     updated_at = Column(
         DateTime,
-        default=lambda: datetime.now(timezone.utc),
-        onupdate=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
+        onupdate=func.now(),
         nullable=False,
     )
 
@@ -54,13 +62,45 @@ engine = create_engine(DATABASE_URL, echo=False)
 SessionLocal: sessionmaker[Session] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-# Enable foreign key enforcement for SQLite
+# Enable foreign key enforcement and write-friendly settings for SQLite
 @event.listens_for(engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
-    """Enable foreign key constraints for SQLite."""
+    """Enable foreign key constraints, WAL journaling and cache tuning for SQLite."""
     cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.executescript(
+        """
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA cache_size=-65536;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA mmap_size=268435456;
+        PRAGMA foreign_keys=ON;
+        """
+    )
+    cursor.close()
+
+
+@contextmanager
+def bulk_mode(conn: Connection) -> Iterator[Connection]:
+    """Relax durability and foreign key checks on one connection for a bulk load.
+
+    Only suitable for loads that can be rerun from scratch if interrupted. The
+    connection is invalidated on exit so the relaxed settings never return to
+    the pool. Must be entered outside a transaction.
+    """
+    cursor = conn.connection.cursor()
+    cursor.executescript(
+        """
+        PRAGMA synchronous=OFF;
+        PRAGMA foreign_keys=OFF;
+        PRAGMA cache_size=-262144;
+        """
+    )
     cursor.close()
+    try:
+        yield conn
+    finally:
+        conn.invalidate()
 
 
 class Product(Base, AuditMixin):
@@ -68,7 +108,7 @@ class Product(Base, AuditMixin):
 
     __tablename__ = "products"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(IdType, primary_key=True, autoincrement=True)
     barcode = Column(
         String, index=True
     )  # Barcode could have leading zeros, make this a string and use id as a primary key
@@ -84,10 +124,10 @@ class Product(Base, AuditMixin):
         "Ingredient", back_populates="product", cascade="all, delete-orphan"
     )
     categories = relationship(
-        "Category", back_populates="product", cascade="all, delete-orphan"
+        "Category", secondary="product_categories", back_populates="products"
     )
     countries = relationship(
-        "Country", back_populates="product", cascade="all, delete-orphan"
+        "Country", secondary="product_countries", back_populates="products"
     )
 
     __table_args__ = (
@@ -100,8 +140,8 @@ class Nutrient(Base, AuditMixin):
 
     __tablename__ = "nutrients"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
+    id = Column(IdType, primary_key=True, autoincrement=True)
+    product_id = Column(IdType, ForeignKey("products.id"), index=True)
     energy_kcal_100g = Column(Float)
     fat_100g = Column(Float)
     saturated_fat_100g = Column(Float)
@@ -115,34 +155,14 @@ class Nutrient(Base, AuditMixin):
     # Relationship
     product = relationship("Product", back_populates="nutrients")
 
-    def __init__(self, **kwargs: Any) -> None:
-        # Round float values to 2 decimal places before storing
-        float_fields = [
-            "energy_kcal_100g",
-            "fat_100g",
-            "saturated_fat_100g",
-            "carbohydrates_100g",
-            "sugars_100g",
-            "fiber_100g",
-            "proteins_100g",
-            "salt_100g",
-            "sodium_100g",
-        ]
-
-        for field in float_fields:
-            if field in kwargs and kwargs[field] is not None:
-                kwargs[field] = round(float(kwargs[field]), 2)
-
-        super().__init__(**kwargs)
-
 
 class Ingredient(Base, AuditMixin):
     """Ingredient model for storing product ingredients."""
 
     __tablename__ = "ingredients"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
+    id = Column(IdType, primary_key=True, autoincrement=True)
+    product_id = Column(IdType, ForeignKey("products.id"), index=True)
     ingredient_text = Column(Text)
 
     # Relationship
@@ -150,35 +170,75 @@ class Ingredient(Base, AuditMixin):
 
 
 class Category(Base, AuditMixin):
-    """Category model for storing product categories."""
+    """Category lookup model, one row per distinct category name."""
 
     __tablename__ = "categories"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
-    category = Column(String)
+    id = Column(IdType, primary_key=True, autoincrement=True)
+    name = Column(String, unique=True, nullable=False)
 
     # Relationship
-    product = relationship("Product", back_populates="categories")
+    products = relationship(
+        "Product", secondary="product_categories", back_populates="categories"
+    )
+
+
+class ProductCategory(Base):
+    """Association model linking products to their categories."""
+
+    __tablename__ = "product_categories"
+
+    product_id = Column(IdType, ForeignKey("products.id"), primary_key=True)
+    category_id = Column(
+        IdType, ForeignKey("categories.id"), primary_key=True, index=True
+    )
 
 
 class Country(Base, AuditMixin):
-    """Country model for storing product origin countries."""
+    """Country lookup model, one row per distinct country name."""
 
     __tablename__ = "countries"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
-    country = Column(String)
+    id = Column(IdType, primary_key=True, autoincrement=True)
+    name = Column(String, unique=True, nullable=False)
 
     # Relationship
-    product = relationship("Product", back_populates="countries")
+    products = relationship(
+        "Product", secondary="product_countries", back_populates="countries"
+    )
+
+
+class ProductCountry(Base):
+    """Association model linking products to their origin countries."""
+
+    __tablename__ = "product_countries"
+
+    product_id = Column(IdType, ForeignKey("products.id"), primary_key=True)
+    country_id = Column(
+        IdType, ForeignKey("countries.id"), primary_key=True, index=True
+    )
+
+
+def _check_legacy_schema() -> None:
+    """Refuse a database whose categories/countries still hold one row per product."""
+    inspector = inspect(engine)
+    for model in (Category, Country):
+        table = model.__tablename__
+        if not inspector.has_table(table):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table)}
+        if "product_id" in columns:
+            raise RuntimeError(
+                f"{engine.url.database} uses the old per-product {table} table; "
+                "delete or migrate food_products.db and run again"
+            )
 
 
 def create_database():
     """Create all tables in the database."""
     logger.info("Creating database tables...")
     try:
+        _check_legacy_schema()
         Base.metadata.create_all(bind=engine)
         db_path = os.path.abspath("food_products.db")
         logger.info("Database created successfully at: %s", db_path)
@@ -188,6 +248,28 @@ def create_database():
         raise
 
 
+def _child_indexes():
+    """Secondary indexes on the tables that reference products."""
+    for model in (Nutrient, Ingredient, ProductCategory, ProductCountry):
+        yield from model.__table__.indexes
+
+
+def drop_child_indexes(conn: Connection) -> None:
+    """Drop child table indexes so bulk inserts skip per-row B-tree updates."""
+    logger.debug("Dropping child table indexes")
+    for index in _child_indexes():
+        index.drop(conn, checkfirst=True)
+    conn.commit()
+
+
+def create_child_indexes(conn: Connection) -> None:
+    """Recreate child table indexes after a bulk load."""
+    logger.debug("Creating child table indexes")
+    for index in _child_indexes():
+        index.create(conn, checkfirst=True)
+    conn.commit()
+
+
 def get_db():
     """Get database session."""
     logger.debug("Creating database session")
@@ -202,8 +284,24 @@ def get_db():
 def get_product_id_by_barcode(barcode: str, db: Session) -> Optional[int]:
     """Lookup product ID by barcode."""
     try:
-        product = db.query(Product).filter(Product.barcode == barcode).first()
-        return int(product.id) if product else None  # type: ignore
+        row = db.query(Product.id).filter(Product.barcode == barcode).first()
+        return int(row.id) if row else None
     except Exception as e:
         logger.error("Error looking up product by barcode %s: %s", barcode, e)
         return None
+
+
+def get_product_ids_by_barcodes(
+    barcodes: Iterable[str], db: Union[Session, Connection], chunk_size: int = 500
+) -> Dict[str, int]:
+    """Lookup product IDs for many barcodes, one IN query per chunk."""
+    barcodes = list(barcodes)
+    product_ids: Dict[str, int] = {}
+    # Chunked to stay under SQLite's bound parameter limit
+    for start in range(0, len(barcodes), chunk_size):
+        chunk = barcodes[start : start + chunk_size]
+        rows = db.execute(
+            select(Product.id, Product.barcode).where(Product.barcode.in_(chunk))
+        )
+        product_ids.update((barcode, product_id) for product_id, barcode in rows)
+    return product_ids
@@ -5,8 +5,21 @@ including normalization, database operations, and batch processing.
 """
 
 import logging
+from contextlib import nullcontext
 from datetime import datetime, timezone
-from typing import Iterator, Dict, Any, Optional
+from functools import lru_cache
+from itertools import islice
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    TypeVar,
+)
 
 from rich.progress import (
     BarColumn,
@@ -16,25 +29,31 @@ from rich.progress import (
     TextColumn,
     TimeRemainingColumn,
 )
-from sqlalchemy.orm.session import Session
+from sqlalchemy.engine import Connection
 
 from src.models import (
-    Category,
-    Country,
-    Ingredient,
-    Nutrient,
-    Product,
-    SessionLocal,
+    bulk_mode,
+    create_child_indexes,
+    drop_child_indexes,
+    engine,
+    get_product_ids_by_barcodes,
 )
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Bound once; sqlite_timestamp runs twice for every product
+_fromts = datetime.fromtimestamp
+_UTC = timezone.utc
+
 
 def split_text(text: str, seperator=":", index=1) -> str:
     """Splits the text by seperator"""
     return text.split(seperator)[index]
 
 
+@lru_cache(maxsize=100_000)
 def normalize_text(text: str) -> str:
     """Normalize text with first word capitalized, rest lowercase"""
     # Replace hyphens with spaces, split into words
@@ -42,12 +61,9 @@ def normalize_text(text: str) -> str:
     if not words:
         return text
 
-    # First word capitalized, rest lowercase, join with spaces
-    return (
-        words[0].capitalize() + " " + " ".join(word.lower() for word in words[1:])
-        if len(words) > 1
-        else words[0].capitalize()
-    )
+    # Lowercase the tail in one call instead of once per word
+    first = words[0].capitalize()
+    return first + " " + " ".join(words[1:]).lower() if len(words) > 1 else first
 
 
 def capitalize_text(text: str):
@@ -55,98 +71,147 @@ def capitalize_text(text: str):
     return text.title()
 
 
-def create_nutrition(product_id: int, product: Dict[str, Any], session: Session) -> None:
-    """Create nutrition for a product"""
-    nutrients = product.get("nutriments", {})
-    barcode = product.get("code", "")
-    if nutrients and barcode:
-
-        product_nutrients = Nutrient(
-            product_id=product_id,
-            energy_kcal_100g=nutrients.get("energy-kcal_100g"),
-            fat_100g=nutrients.get("fat_100g"),
-            saturated_fat_100g=nutrients.get("saturated-fat_100g"),
-            carbohydrates_100g=nutrients.get("carbohydrates_100g"),
-            sugars_100g=nutrients.get("sugars_100g"),
-            fiber_100g=nutrients.get("fiber_100g"),
-            proteins_100g=nutrients.get("proteins_100g"),
-            salt_100g=nutrients.get("salt_100g"),
-            sodium_100g=nutrients.get("sodium_100g"),
-            created_at=datetime.fromtimestamp(
-                product.get("created_t", 0), tz=timezone.utc
-            ),
-            updated_at=datetime.fromtimestamp(
-                product.get("last_modified_t", 0), tz=timezone.utc
-            ),
-        )
-        session.add(product_nutrients)
-
+@lru_cache(maxsize=100_000)
+def _norm_tag(tag: str) -> Optional[str]:
+    """Normalize a language-prefixed tag such as "en:united-states".
+
+    Returns None when the tag has no "lang:" prefix.
+    """
+    _, sep, name = tag.partition(":")
+    return normalize_text(name) if sep else None
+
+
+@lru_cache(maxsize=100_000)
+def _ingredient_text(tag: str) -> Optional[str]:
+    """Ingredient name from a tag such as "en:palm-oil", or None without a prefix"""
+    _, sep, name = normalize_text(tag).partition(":")
+    return name if sep else None
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    """Group items into lists of up to batch_size"""
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+    iterator = iter(items)
+    return iter(lambda: list(islice(iterator, batch_size)), [])
+
+
+class NutrientRow(NamedTuple):
+    """Positional nutrients row, in INSERT_NUTRIENT_SQL column order"""
+
+    product_id: int
+    energy_kcal_100g: Optional[float]
+    fat_100g: Optional[float]
+    saturated_fat_100g: Optional[float]
+    carbohydrates_100g: Optional[float]
+    sugars_100g: Optional[float]
+    fiber_100g: Optional[float]
+    proteins_100g: Optional[float]
+    salt_100g: Optional[float]
+    sodium_100g: Optional[float]
+    created_at: str
+    updated_at: str
+
+
+class IngredientRow(NamedTuple):
+    """Positional ingredients row, in INSERT_INGREDIENT_SQL column order"""
+
+    product_id: int
+    ingredient_text: str
+    created_at: str
+    updated_at: str
+
+
+# OpenFoodFacts nutriment keys, in NutrientRow column order
+_NUT_KEYS = (
+    "energy-kcal_100g",
+    "fat_100g",
+    "saturated-fat_100g",
+    "carbohydrates_100g",
+    "sugars_100g",
+    "fiber_100g",
+    "proteins_100g",
+    "salt_100g",
+    "sodium_100g",
+)
 
-def create_ingredients(product_id: int, product: Dict[str, Any], session: Session) -> None:
-    """Create ingredients for a product"""
-    ingredients = product.get("ingredients_tags", [])
-    barcode = product.get("code", "")
-    if ingredients and barcode:
-        for ingredient in ingredients:
-            try:
-                product_ingredients = Ingredient(
-                    product_id=product_id,
-                    ingredient_text=split_text(normalize_text(ingredient)),
-                    created_at=datetime.fromtimestamp(
-                        product.get("created_t", 0), tz=timezone.utc
-                    ),
-                    updated_at=datetime.fromtimestamp(
-                        product.get("last_modified_t", 0), tz=timezone.utc
-                    ),
-                )
-                session.add(product_ingredients)
-            except IndexError as e:
-                logger.error("Error saving ingredient %s: %s", ingredient, e)
-                continue
 
-
-def create_categories(product_id: int, product: Dict[str, Any], session: Session) -> None:
-    """Create categories for a product"""
-    categories = product.get("categories", "")
-    barcode = product.get("code", "")
-    if categories and barcode:
-
-        for category in categories.split(","):
-            product_categories = Category(
-                product_id=product_id,
-                category=category.strip(),
-                created_at=datetime.fromtimestamp(
-                    product.get("created_t", 0), tz=timezone.utc
-                ),
-                updated_at=datetime.fromtimestamp(
-                    product.get("last_modified_t", 0), tz=timezone.utc
-                ),
-            )
-            session.add(product_categories)
+def round_nutrients(values: Iterable[Any]) -> List[Optional[float]]:
+    """Round nutrient values to 2 decimal places, keeping missing values"""
+    return [None if value is None else round(float(value), 2) for value in values]
 
 
-def create_countries(product_id: int, product: Dict[str, Any], session: Session) -> None:
-    """Create countries for a product"""
-    countries = product.get("countries_tags", [])
+def create_nutrition(
+    product_id: int,
+    product: Dict[str, Any],
+    created_at: str,
+    updated_at: str,
+    rows: List[NutrientRow],
+) -> None:
+    """Create nutrition row for a product"""
+    nutrients = product.get("nutriments", {})
     barcode = product.get("code", "")
-    if countries and barcode:
+    if nutrients and barcode:
 
-        for country in countries:
-            try:
-                product_countries = Country(
-                    product_id=product_id,
-                    country=capitalize_text(normalize_text(country.split(":")[1])),
-                    created_at=datetime.fromtimestamp(
-                        product.get("created_t", 0), tz=timezone.utc
-                    ),
-                    updated_at=datetime.fromtimestamp(
-                        product.get("last_modified_t", 0), tz=timezone.utc
-                    ),
-                )
-                session.add(product_countries)
-            except IndexError as e:
-                logger.error("Error saving country %s: %s", country, e)
-                continue
+        values = round_nutrients(map(nutrients.get, _NUT_KEYS))
+        rows.append(NutrientRow(product_id, *values, created_at, updated_at))
+
+
+class LinkRow(NamedTuple):
+    """A product's link to a lookup table name, resolved to an id on insert"""
+
+    product_id: int
+    name: str
+
+
+class RelatedRows(NamedTuple):
+    """Per-batch row lists for the tables that reference products"""
+
+    ingredients: List[IngredientRow]
+    categories: List[LinkRow]
+    countries: List[LinkRow]
+
+
+def create_related(
+    product_id: int,
+    product: Dict[str, Any],
+    created_at: str,
+    updated_at: str,
+    rows: RelatedRows,
+) -> None:
+    """Create ingredient rows and category/country links for a product"""
+    add_ingredient = rows.ingredients.append
+    for ingredient in product.get("ingredients_tags") or ():
+        text = _ingredient_text(ingredient)
+        if text is None:
+            logger.error("Error saving ingredient %s: no language prefix", ingredient)
+            continue
+        add_ingredient(IngredientRow(product_id, text, created_at, updated_at))
+
+    add_category = rows.categories.append
+    for category in (product.get("categories") or "").split(","):
+        name = category.strip()
+        if name:
+            add_category(LinkRow(product_id, name))
+
+    add_country = rows.countries.append
+    for country in product.get("countries_tags") or ():
+        name = _norm_tag(country)
+        if name is None:
+            logger.error("Error saving country %s: no language prefix", country)
+            continue
+        add_country(LinkRow(product_id, capitalize_text(name)))
+
+
+# Priority order: English first, then generic text, then the other languages
+# in the alphabetical order OpenFoodFacts emits its packaging_text_* keys
+_PACKAGING_KEYS = ("packaging_text_en", "packaging_text") + tuple(
+    f"packaging_text_{lang}"
+    for lang in (
+        "ar bg ca cs da de el es et fi fr he hr hu id it ja ko "
+        "lt lv nb nl no pl pt ro ru sk sl sr sv th tr uk vi zh"
+    ).split()
+)
 
 
 def get_packaging(product: Dict[str, Any]) -> str:
@@ -154,24 +219,20 @@ def get_packaging(product: Dict[str, Any]) -> str:
     if not product or not isinstance(product, dict):
         return ""
 
-    # Priority order: English first, then any other language
-    packaging_keys = [
-        "packaging_text_en",  # English (highest priority)
-        "packaging_text",  # Generic packaging text
-    ]
-
-    # Check priority keys first
-    for key in packaging_keys:
+    # Direct lookups first, instead of scanning every key of the product
+    for key in _PACKAGING_KEYS:
         value = product.get(key, "")
         if value and isinstance(value, str) and value.strip():
             return normalize_text(value.strip())
 
-    # Fallback: find any packaging_text_* key with a value
-    # Only check keys that start with 'packaging_text' for better performance
-    packaging_text_keys = [k for k in product.keys() if k.startswith("packaging_text")]
-    for key in packaging_text_keys:
-        value = product.get(key, "")
-        if value and isinstance(value, str) and value.strip():
+    # Fallback: any other packaging_text_* key, e.g. a less common language
+    for key, value in product.items():
+        if (
+            key.startswith("packaging_text")
+            and value
+            and isinstance(value, str)
+            and value.strip()
+        ):
             return normalize_text(value.strip())
 
     # If all else fails, pull from the packaging_tags array
@@ -194,101 +255,320 @@ def get_packaging(product: Dict[str, Any]) -> str:
     return ""
 
 
-def create_product(product: Dict[str, Any], session: Session) -> bool:
-    """Create a product and return True if created, False if skipped"""
+class ProductRow(NamedTuple):
+    """Column values for one products row, in INSERT_PRODUCT_SQL order"""
+
+    barcode: str
+    product_name: str
+    brands: str
+    packaging: str
+    created_at: str
+    updated_at: str
+
+
+def _insert_sql(table: str, fields: Iterable[str], verb: str = "INSERT") -> str:
+    """Build a positional INSERT statement for the DBAPI cursor"""
+    fields = tuple(fields)
+    return "{} INTO {} ({}) VALUES ({})".format(
+        verb, table, ", ".join(fields), ", ".join("?" * len(fields))
+    )
+
+
+INSERT_PRODUCT_SQL = _insert_sql("products", ProductRow._fields)
+INSERT_NUTRIENT_SQL = _insert_sql("nutrients", NutrientRow._fields)
+INSERT_INGREDIENT_SQL = _insert_sql("ingredients", IngredientRow._fields)
+SELECT_BARCODES_SQL = "SELECT barcode FROM products"
+
+
+class LookupSql(NamedTuple):
+    """Statements for a lookup table and the table linking it to products"""
+
+    insert_names: str
+    select_ids: str
+    insert_links: str
+
+
+def _lookup_sql(lookup: str, link: str, link_column: str) -> LookupSql:
+    """Build the statements that link_lookup_names runs for one lookup table"""
+    return LookupSql(
+        insert_names=_insert_sql(lookup, ("name",), "INSERT OR IGNORE"),
+        select_ids=f"SELECT name, id FROM {lookup} WHERE name IN ({{}})",
+        insert_links=_insert_sql(link, ("product_id", link_column)),
+    )
+
+
+CATEGORY_SQL = _lookup_sql("categories", "product_categories", "category_id")
+COUNTRY_SQL = _lookup_sql("countries", "product_countries", "country_id")
+
+
+def sqlite_timestamp(epoch: float) -> str:
+    """Format a Unix timestamp the way SQLAlchemy stores DateTime in SQLite"""
+    # "YYYY-MM-DD HH:MM:SS.ffffff", dropping isoformat's "+00:00" suffix
+    return _fromts(epoch, _UTC).isoformat(" ", "microseconds")[:26]
+
+
+def _parse_barcode(code: Any) -> str:
+    """Normalize a product code to the string stored in products.barcode.
+
+    Codes stay strings since they can have leading zeros; numeric codes are
+    converted and anything else is treated as missing.
+    """
+    if isinstance(code, str):
+        return code.strip()
+    if isinstance(code, int) and not isinstance(code, bool):
+        return str(code)
+    return ""
+
+
+def create_product(
+    product: Dict[str, Any], existing_barcodes: Set[str]
+) -> Optional[ProductRow]:
+    """Create a product row, or return None if the product should be skipped.
+
+    existing_barcodes holds every barcode already stored or seen in this run
+    and is updated with the new barcode.
+    """
+    barcode = _parse_barcode(product.get("code"))
+    if not barcode:
+        logger.warning("Skipping product with empty barcode")
+        return None
+
+    # Check if product already exists
+    if barcode in existing_barcodes:
+        logger.debug("Product with barcode %s already exists, skipping", barcode)
+        return None
+
+    row = ProductRow(
+        barcode=barcode,
+        product_name=product.get("product_name", product.get("name", "")),
+        brands=product.get("brands", ""),
+        packaging=get_packaging(product),
+        created_at=sqlite_timestamp(product.get("created_t", 0)),
+        updated_at=sqlite_timestamp(product.get("last_modified_t", 0)),
+    )
+    # Only mark the barcode as seen once its row exists, so a malformed record
+    # cannot block a later valid one with the same code
+    existing_barcodes.add(barcode)
+    return row
+
+
+def bulk_insert_raw(conn: Connection, sql: str, rows: List[Any]) -> None:
+    """Insert positional rows with the DBAPI cursor's executemany.
+
+    Bypasses SQLAlchemy statement compilation and parameter processing while
+    still running inside the connection's current transaction.
+    """
+    cursor = conn.connection.cursor()
     try:
-        barcode = product.get("code", "")
-        if not barcode:
-            logger.warning("Skipping product with empty barcode")
-            return False
-
-        # Check if product already exists
-        existing_product = (
-            session.query(Product).filter(Product.barcode == barcode).first()
-        )
-        if existing_product:
-            logger.debug("Product with barcode %s already exists, skipping", barcode)
-            return False
-
-        # Create new product using utility functions
-        new_product = Product(
-            barcode=barcode,
-            product_name=product.get("product_name", product.get("name", "")),
-            brands=product.get("brands", ""),
-            packaging=get_packaging(product),
-            created_at=datetime.fromtimestamp(
-                product.get("created_t", 0), tz=timezone.utc
-            ),
-            updated_at=datetime.fromtimestamp(
-                product.get("last_modified_t", 0), tz=timezone.utc
-            ),
+        cursor.executemany(sql, rows)
+    finally:
+        cursor.close()
+
+
+def link_lookup_names(
+    conn: Connection,
+    sql: LookupSql,
+    rows: List[LinkRow],
+    name_ids: Dict[str, int],
+) -> None:
+    """Link products to deduplicated lookup rows (categories, countries).
+
+    Names not yet in name_ids are inserted if missing and their ids cached,
+    so each distinct name is stored once no matter how many products use it.
+    """
+    missing = sorted({row.name for row in rows} - name_ids.keys())
+    cursor = conn.connection.cursor()
+    try:
+        # Stay under SQLite's bound parameter limit
+        for names in batched(missing, 500):
+            cursor.executemany(sql.insert_names, [(name,) for name in names])
+            cursor.execute(sql.select_ids.format(", ".join("?" * len(names))), names)
+            name_ids.update(cursor.fetchall())
+
+        # A product may list the same name twice; link it only once
+        cursor.executemany(
+            sql.insert_links, {(row.product_id, name_ids[row.name]) for row in rows}
         )
-        session.add(new_product)
-        logger.debug("Before flush: new_product.id = %s", new_product.id)
-        session.flush()  # Get the autoincremented ID without committing
-        logger.debug("After flush: new_product.id = %s", new_product.id)
+    finally:
+        cursor.close()
+
+
+def insert_products(
+    conn: Connection,
+    products: List[Dict[str, Any]],
+    existing_barcodes: Set[str],
+    category_ids: Dict[str, int],
+    country_ids: Dict[str, int],
+) -> int:
+    """Bulk insert a batch of products and their related data.
+
+    existing_barcodes, category_ids and country_ids carry state across batches.
+    Returns the number of products saved.
+    """
+    new_products = []
+    for product in products:
+        try:
+            row = create_product(product, existing_barcodes)
+        except Exception as e:
+            logger.error(
+                "Failed to process product %s: %s", product.get("code", "unknown"), e
+            )
+            continue
+        if row:
+            new_products.append((row, product))
 
-        # Create related data
-        product_id: int = new_product.id  # type: ignore
-        create_nutrition(product_id=product_id, product=product, session=session)
-        create_ingredients(product_id=product_id, product=product, session=session)
-        create_categories(product_id=product_id, product=product, session=session)
-        create_countries(product_id=product_id, product=product, session=session)
+    if not new_products:
+        return 0
 
-        return True
+    # In barcode order the barcode index is appended to instead of split
+    new_products.sort(key=lambda pair: pair[0].barcode)
+    product_rows = [row for row, _ in new_products]
+
+    # One executemany for the whole batch, then resolve the new ids in bulk
+    bulk_insert_raw(conn, INSERT_PRODUCT_SQL, product_rows)
+    product_ids = get_product_ids_by_barcodes(
+        (row.barcode for row in product_rows), conn
+    )
+
+    nutrient_rows: List[NutrientRow] = []
+    related = RelatedRows([], [], [])
+    row_lists = (nutrient_rows, *related)
+    for row, product in new_products:
+        product_id = product_ids[row.barcode]
+        # Related rows share the product's already formatted timestamps
+        created_at, updated_at = row.created_at, row.updated_at
+        sizes = [len(rows) for rows in row_lists]
+        try:
+            create_nutrition(
+                product_id, product, created_at, updated_at, nutrient_rows
+            )
+            create_related(product_id, product, created_at, updated_at, related)
+        except Exception as e:
+            # Keep the product itself, but drop any rows it partly added
+            logger.error("Failed to process product %s: %s", row.barcode, e)
+            for rows, size in zip(row_lists, sizes):
+                del rows[size:]
+
+    for sql, rows in (
+        (INSERT_NUTRIENT_SQL, nutrient_rows),
+        (INSERT_INGREDIENT_SQL, related.ingredients),
+    ):
+        if rows:
+            bulk_insert_raw(conn, sql, rows)
+
+    if related.categories:
+        link_lookup_names(conn, CATEGORY_SQL, related.categories, category_ids)
+    if related.countries:
+        link_lookup_names(conn, COUNTRY_SQL, related.countries, country_ids)
+
+    return len(product_rows)
+
+
+def prefetch_barcodes(conn: Connection) -> Set[str]:
+    """Read every stored barcode straight from the DBAPI cursor"""
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(SELECT_BARCODES_SQL)
+        return {barcode for (barcode,) in cursor}
+    finally:
+        cursor.close()
+
+
+def _begin_immediate(conn: Connection) -> None:
+    """Start a transaction that takes the SQLite write lock up front"""
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
 
-    except Exception as e:
-        logger.error("Error creating product %s: %s", product.get("code", "unknown"), e)
-        raise  # Re-raise to let save_data handle the rollback
 
+def save_batches(
+    batches: Iterator[List[Dict[str, Any]]],
+    total_count: Optional[int] = None,
+    commit_size: int = 5000,
+) -> None:
+    """Process an iterator of product batches.
 
-def save_data(products: Iterator[Dict[str, Any]], total_count: Optional[int] = None) -> None:
-    """Process the products iterator"""
-    session = SessionLocal()
+    Each batch is written with one executemany per table, and batches are
+    committed roughly every commit_size products, each chunk in its own
+    BEGIN IMMEDIATE transaction. When loading into an empty database the
+    child table indexes are dropped for the duration of the load and rebuilt
+    once at the end, and the load runs in bulk_mode since it can simply be
+    rerun if interrupted.
+    """
     products_saved = 0
     products_processed = 0
+    uncommitted = 0
+    category_ids: Dict[str, int] = {}
+    country_ids: Dict[str, int] = {}
 
-    try:
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[bold blue]Saving products..."),
-            BarColumn(),
-            TaskProgressColumn(),
-            TextColumn("products"),
-            TimeRemainingColumn(),
-            console=None,
-        ) as progress:
-            task = progress.add_task("Saving", total=total_count)
-
-            for product in products:
-                try:
-                    if create_product(product, session):
-                        products_saved += 1
-                    products_processed += 1
-                    progress.update(task, advance=1)
-                except Exception as e:
-                    logger.error(
-                        "Failed to process product %s: %s",
-                        product.get("code", "unknown"),
-                        e,
-                    )
-                    products_processed += 1
-                    progress.update(task, advance=1)
-                    # Continue processing other products
-
-        # Single commit for all products at the end
-        session.commit()
-        logger.info("Transaction committed successfully")
-
-    except Exception as e:
-        logger.error("Error during batch processing: %s", e)
-        session.rollback()
-        logger.info("Transaction rolled back")
-        raise
-    finally:
-        logger.info("Products processed: %d", products_processed)
-        logger.info("Products saved to database: %d", products_saved)
-        logger.info(
-            "Products skipped (duplicates): %d", products_processed - products_saved
-        )
-        session.close()
+    # Prefetch, index maintenance and the load itself share one connection
+    with engine.connect() as conn:
+        # One query up front instead of an existence check per product
+        existing_barcodes = prefetch_barcodes(conn)
+        conn.commit()
+        bulk_load = not existing_barcodes
+
+        with bulk_mode(conn) if bulk_load else nullcontext():
+            if bulk_load:
+                drop_child_indexes(conn)
+
+            try:
+                with Progress(
+                    SpinnerColumn(),
+                    TextColumn("[bold blue]Saving products..."),
+                    BarColumn(),
+                    TaskProgressColumn(),
+                    TextColumn("products"),
+                    TimeRemainingColumn(),
+                    console=None,
+                ) as progress:
+                    task = progress.add_task("Saving", total=total_count)
+
+                    for batch in batches:
+                        if not uncommitted:
+                            _begin_immediate(conn)
+                        products_saved += insert_products(
+                            conn, batch, existing_barcodes, category_ids, country_ids
+                        )
+                        products_processed += len(batch)
+                        uncommitted += len(batch)
+                        progress.update(task, advance=len(batch))
+
+                        if uncommitted >= commit_size:
+                            conn.commit()
+                            uncommitted = 0
+
+                    if uncommitted:
+                        conn.commit()
+                        uncommitted = 0
+
+                logger.info("Transaction committed successfully")
+
+            except Exception as e:
+                logger.error("Error during batch processing: %s", e)
+                raise
+            finally:
+                # Also reached on KeyboardInterrupt; the index rebuild below
+                # commits, so discard the unfinished chunk before it runs
+                if conn.in_transaction():
+                    conn.rollback()
+                    if uncommitted:
+                        logger.info(
+                            "Transaction rolled back (%d products)", uncommitted
+                        )
+                if bulk_load:
+                    create_child_indexes(conn)
+                logger.info("Products processed: %d", products_processed)
+                logger.info("Products saved to database: %d", products_saved)
+                logger.info(
+                    "Products skipped (duplicates): %d",
+                    products_processed - products_saved,
+                )
+
+
+def save_data(
+    products: Iterator[Dict[str, Any]],
+    total_count: Optional[int] = None,
+    batch_size: int = 1000,
+    commit_size: int = 5000,
+) -> None:
+    """Process the products iterator, batch_size products at a time"""
+    save_batches(batched(products, batch_size), total_count, commit_size)
@@ -0,0 +1,322 @@
+"""Unit tests for the api module using stubbed HTTP calls."""
+
+import gzip
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+from src import api as api_module
+from src.api import OpenFoodFactsAPI, RateLimiter, _parse_retry_after
+
+
+@pytest.fixture
+def api():
+    """API client whose session is closed after the test."""
+    with OpenFoodFactsAPI() as client:
+        yield client
+
+
+def _http_error(status_code, headers=None):
+    """Fake request error carrying a response, like niquests' HTTPError."""
+    return SimpleNamespace(
+        response=SimpleNamespace(status_code=status_code, headers=headers or {})
+    )
+
+
+def _http_date(offset_seconds):
+    """HTTP-date for now plus offset_seconds."""
+    moment = datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)
+    return format_datetime(moment, usegmt=True)
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        ("120", 120.0),
+        ("1.5", 1.5),
+        ("-5", 0.0),
+        (None, None),
+        ("", None),
+        ("soon", None),
+        ("inf", None),
+        ("nan", None),
+    ],
+    ids=[
+        "seconds",
+        "fractional_seconds",
+        "negative_seconds",
+        "missing",
+        "empty",
+        "garbage",
+        "infinite",
+        "not_a_number",
+    ],
+)
+def test_parse_retry_after(value, expected):
+    """Test _parse_retry_after with delta-seconds and invalid values."""
+    assert _parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    """Test _parse_retry_after with future and past HTTP-dates."""
+    assert 28 <= _parse_retry_after(_http_date(30)) <= 30
+    assert _parse_retry_after(_http_date(-3600)) == 0.0
+
+
+def test_retry_delay_gives_up_on_non_retryable_status(api):
+    """Test _retry_delay does not retry a 404."""
+    assert api._retry_delay(0, _http_error(404)) is None
+
+
+def test_retry_delay_gives_up_after_max_retries(api):
+    """Test _retry_delay stops once every attempt is used."""
+    assert api._retry_delay(api.max_retries, _http_error(503)) is None
+
+
+def test_retry_delay_backs_off_on_server_error(api):
+    """Test _retry_delay uses jittered exponential backoff for a 503."""
+    delay = api._retry_delay(2, _http_error(503))
+
+    assert 2.0 <= delay <= 4.0
+
+
+def test_retry_delay_retries_connection_errors(api):
+    """Test _retry_delay retries errors that carry no response."""
+    assert api._retry_delay(0, SimpleNamespace(response=None)) is not None
+
+
+def test_retry_delay_honours_retry_after_on_429(api):
+    """Test _retry_delay waits Retry-After and pauses the shared limiter."""
+    delay = api._retry_delay(0, _http_error(429, {"Retry-After": "7"}))
+
+    assert delay == 7.0
+    # Every other pending request is held back for the same time
+    assert api.limiter.reserve() == pytest.approx(7.0, abs=0.1)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock for the api module, advanced by hand."""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(api_module, "monotonic", lambda: now.value)
+    return now
+
+
+def test_rate_limiter_allows_a_burst_then_spaces_requests(clock):
+    """Test RateLimiter lets 100 requests through, then one per 0.6s."""
+    limiter = RateLimiter(calls=100, period=60.0)
+
+    assert [limiter.reserve() for _ in range(100)] == [0.0] * 100
+    assert limiter.reserve() == pytest.approx(0.6)
+    assert limiter.reserve() == pytest.approx(1.2)
+
+    # Once the clock catches up, requests are again spaced 0.6s apart
+    clock.value += 1.2
+    assert limiter.reserve() == pytest.approx(0.6)
+
+
+def test_rate_limiter_pause_delays_the_next_reservation(clock):
+    """Test RateLimiter.pause holds back requests for the given time."""
+    limiter = RateLimiter(calls=100, period=60.0)
+    limiter.reserve()
+
+    limiter.pause(10.0)
+
+    assert limiter.reserve() == pytest.approx(10.0)
+    clock.value += 10.0
+    assert limiter.reserve() == pytest.approx(0.6)
+
+
+@pytest.mark.parametrize(
+    "paginate", [api_module.paginate_products, api_module.paginate_products_batched]
+)
+def test_paginate_function_closes_session_when_exhausted(monkeypatch, paginate):
+    """Test the module-level paginate helpers close their API session."""
+    closed = []
+    monkeypatch.setattr(
+        OpenFoodFactsAPI,
+        "paginate_products_batched",
+        lambda self, *args: (iter([[{"code": "1"}]]), 1),
+    )
+    monkeypatch.setattr(OpenFoodFactsAPI, "close", lambda self: closed.append(self))
+
+    iterator, total_count = paginate("https://example.org", {})
+
+    assert total_count == 1
+    assert closed == []
+    list(iterator)
+    assert len(closed) == 1
+
+
+def test_iterate_pages_skips_only_the_failed_page(api):
+    """Test a page that exhausts its retries does not cancel the other pages."""
+
+    async def fake_request(session, url, params=None):
+        page = int(url.rsplit("=", 1)[1])
+        if page == 3:
+            raise api_module.niq.HTTPError("404 Not Found")
+        return SimpleNamespace(content=orjson.dumps({"products": [{"page": page}]}))
+
+    api._make_request_with_retry_async = fake_request
+
+    pages = dict(api._iterate_pages({}, range(2, 7)))
+
+    assert pages == {
+        2: [{"page": 2}],
+        3: [],
+        4: [{"page": 4}],
+        5: [{"page": 5}],
+        6: [{"page": 6}],
+    }
+
+
+def _products(start, count):
+    """List of count fake products with consecutive codes from start."""
+    return [{"code": str(code)} for code in range(start, start + count)]
+
+
+@pytest.fixture
+def paged_api(api):
+    """API client serving 10 products in pages of 3 without any HTTP.
+
+    requested_pages records the page range handed to _iterate_pages.
+    """
+    api.page_size = 3
+    api.requested_pages = []
+    first_page = orjson.dumps({"count": 10, "products": _products(0, 3)})
+    api._make_request_with_retry = lambda url, params=None: SimpleNamespace(
+        content=first_page
+    )
+
+    def iterate_pages(params, pages):
+        api.requested_pages.append(pages)
+        for page in pages:
+            yield page, _products((page - 1) * 3, min(3, 10 - (page - 1) * 3))
+
+    api._iterate_pages = iterate_pages
+    return api
+
+
+def test_paginate_products_batched_reslices_pages(paged_api):
+    """Test pages are regrouped into batch_size lists with the remainder last."""
+    batches, total_count = paged_api.paginate_products_batched({}, batch_size=4)
+
+    batches = list(batches)
+
+    assert total_count == 10
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert [p["code"] for batch in batches for p in batch] == [
+        str(code) for code in range(10)
+    ]
+    assert paged_api.requested_pages == [range(2, 5)]
+
+
+def test_paginate_products_batched_respects_max_pages(paged_api):
+    """Test max_pages caps the page range requested after the first page."""
+    batches, _ = paged_api.paginate_products_batched({}, max_pages=2, batch_size=4)
+
+    assert [len(batch) for batch in batches] == [4, 2]
+    assert paged_api.requested_pages == [range(2, 3)]
+
+
+def test_paginate_products_batched_continues_past_empty_page(paged_api):
+    """Test an empty page in the middle does not end pagination."""
+
+    def iterate_pages(params, pages):
+        yield 3, _products(6, 3)
+        yield 2, []
+        yield 4, _products(9, 1)
+
+    paged_api._iterate_pages = iterate_pages
+
+    batches, _ = paged_api.paginate_products_batched({}, batch_size=100)
+
+    assert [len(batch) for batch in batches] == [7]
+
+
+def test_paginate_products_batched_stops_on_error(paged_api):
+    """Test a fetch error ends pagination but keeps the products already fetched."""
+
+    def iterate_pages(params, pages):
+        yield 2, _products(3, 3)
+        raise api_module.niq.RequestException("connection reset")
+
+    paged_api._iterate_pages = iterate_pages
+
+    batches, _ = paged_api.paginate_products_batched({}, batch_size=4)
+
+    assert [len(batch) for batch in batches] == [4, 2]
+
+
+def test_paginate_products_batched_initial_request_fails(api):
+    """Test a failed first request yields nothing and a zero count."""
+
+    def fail(url, params=None):
+        raise api_module.niq.RequestException("connection refused")
+
+    api._make_request_with_retry = fail
+
+    batches, total_count = api.paginate_products_batched({})
+
+    assert (list(batches), total_count) == ([], 0)
+
+
+@pytest.mark.parametrize(
+    "base_url,expected",
+    [
+        (
+            "https://example.org/search",
+            "https://example.org/search?search_terms=choc+bar&json=1&page_size=250&page=",
+        ),
+        (
+            "https://example.org/search?lc=en",
+            "https://example.org/search?lc=en&search_terms=choc+bar&json=1&page_size=250&page=",
+        ),
+    ],
+    ids=["plain_url", "url_with_query"],
+)
+def test_page_url_prefix(base_url, expected):
+    """Test _page_url_prefix encodes the query once and ends with page=."""
+    with OpenFoodFactsAPI(base_url) as client:
+        prefix = client._page_url_prefix({"search_terms": "choc bar", "json": 1})
+
+    assert prefix == expected
+
+
+def test_paginate_products_batched_rejects_non_positive_batch_size(paged_api):
+    """Test batch_size=0 raises instead of yielding empty batches forever."""
+    with pytest.raises(ValueError, match="batch_size"):
+        paged_api.paginate_products_batched({}, batch_size=0)
+
+
+def test_iter_openfoodfacts_dump_skips_blank_lines(tmp_path):
+    """Test iter_openfoodfacts_dump yields one product per non-blank line."""
+    path = tmp_path / "products.jsonl.gz"
+    with gzip.open(path, "wb") as f:
+        f.write(b'{"code": "1"}\n\n{"code": "2"}\n')
+
+    assert list(api_module.iter_openfoodfacts_dump(str(path))) == [
+        {"code": "1"},
+        {"code": "2"},
+    ]
+
+
+def test_wait_for_slot_reserves_again_after_a_pause(api, clock, monkeypatch):
+    """Test a request sleeping on its reservation honours a pause made meanwhile."""
+    api.limiter = RateLimiter(calls=100, period=60.0)
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 1:
+            # Another request hits a 429 while this one is waiting
+            api.limiter.pause(5.0)
+
+    monkeypatch.setattr(api_module, "sleep", fake_sleep)
+
+    api._wait_for_slot()
+
+    assert sleeps == [0.0, pytest.approx(5.0)]
@@ -1,69 +1,130 @@
 """Unit tests for the process module using mock data."""
 
-import json
-from datetime import datetime, timezone
-from unittest.mock import MagicMock, patch
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+
+import orjson
 import pytest
+from sqlalchemy import create_engine, event
 
+from src import models, process
 from src.process import (
+    RelatedRows,
+    batched,
     capitalize_text,
-    create_categories,
-    create_countries,
     create_nutrition,
     create_product,
+    create_related,
     get_packaging,
     normalize_text,
+    save_data,
     split_text,
+    sqlite_timestamp,
 )
 
+_JSON_PATH = Path(__file__).with_name("mock_response.json")
+
+# Mock product's nutriments, rounded to 2 decimal places
+_EXPECTED_NUTRITION = MappingProxyType(
+    {
+        "product_id": 1,
+        "energy_kcal_100g": 539,
+        "fat_100g": 30.9,
+        "saturated_fat_100g": 10.6,
+        "carbohydrates_100g": 57.5,
+        "sugars_100g": 56.3,
+        "proteins_100g": 6.3,
+        "salt_100g": 0.11,
+        "sodium_100g": 0.04,
+    }
+)
 
-@pytest.fixture
+# Mock product's created_t as stored by SQLAlchemy in SQLite
+_EXPECTED_CREATED_AT = "2016-03-11 07:17:32.000000"
+
+
+@lru_cache(maxsize=None)
+def _load_mock_response():
+    """Parse the mock JSON file, at most once per process."""
+    return orjson.loads(_JSON_PATH.read_bytes())
+
+
+@pytest.fixture(scope="session")
 def mock_response():
-    """Load mock data from JSON file."""
-    with open("./mock_response.json", "r") as f:
-        return json.load(f)
+    """Load mock data from JSON file once per test session."""
+    return _load_mock_response()
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def mock_product(mock_response):
     """Extract product data from mock response."""
     return mock_response["product"]
 
 
 @pytest.fixture
-def mock_session():
-    """Create mock session."""
-    return MagicMock()
-
-
-def test_split_text_default_separator():
-    """Test split_text function with default separator and index."""
-    result = split_text("en:sugar", ":", 1)
-    assert result == "sugar"
-
-
-def test_split_text_custom_separator():
-    """Test split_text function with custom separator."""
-    result = split_text("a-b-c", "-", 1)
-    assert result == "b"
-
-
-def test_split_text_index_zero():
-    """Test split_text function with index 0."""
-    result = split_text("en:sugar", ":", 0)
-    assert result == "en"
+def db_engine(tmp_path, monkeypatch):
+    """Point the process module at an empty SQLite database under tmp_path."""
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'food_products.db'}")
+    event.listen(test_engine, "connect", models.set_sqlite_pragma)
+    models.Base.metadata.create_all(test_engine)
+    monkeypatch.setattr(models, "engine", test_engine)
+    monkeypatch.setattr(process, "engine", test_engine)
+    yield test_engine
+    test_engine.dispose()
+
+
+def _fetch(engine, sql):
+    """Run a query against the test database and return all rows."""
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(sql).all()
+
+
+@pytest.fixture(scope="session")
+def mock_categories_count(mock_product):
+    """Number of comma separated categories on the mock product."""
+    return mock_product["categories"].count(",") + 1
+
+
+@pytest.mark.parametrize(
+    "text,seperator,index,expected",
+    [
+        ("en:sugar", ":", 1, "sugar"),
+        ("a-b-c", "-", 1, "b"),
+        ("en:sugar", ":", 0, "en"),
+    ],
+    ids=["default_separator", "custom_separator", "index_zero"],
+)
+def test_split_text(text, seperator, index, expected):
+    """Test split_text function with various separators and indexes."""
+    assert split_text(text, seperator, index) == expected
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("sugar", "Sugar"),
+        ("palm-oil", "Palm oil"),
+    ],
+    ids=["basic", "with_hyphens"],
+)
+def test_normalize_text(text, expected):
+    """Test normalize_text function."""
+    assert normalize_text(text) == expected
 
 
-def test_normalize_text_basic():
-    """Test normalize_text function with basic input."""
-    result = normalize_text("sugar")
-    assert result == "Sugar"
+def test_batched():
+    """Test batched groups products into lists with a short final batch."""
+    products = [{"code": str(i)} for i in range(5)]
+    result = list(batched(products, 2))
+    assert [len(batch) for batch in result] == [2, 2, 1]
 
 
-def test_normalize_text_with_hyphens():
-    """Test normalize_text function with hyphens."""
-    result = normalize_text("palm-oil")
-    assert result == "Palm oil"
+@pytest.mark.parametrize("batch_size", [0, -1])
+def test_save_data_rejects_non_positive_batch_size(batch_size):
+    """Test save_data raises instead of silently writing nothing."""
+    with pytest.raises(ValueError, match="batch_size"):
+        save_data(iter([{"code": "1"}]), batch_size=batch_size)
 
 
 def test_capitalize_text():
@@ -72,79 +133,216 @@ def test_capitalize_text():
     assert result == "Hello World"
 
 
-def test_create_nutrition_success(mock_product, mock_session):
+def test_create_nutrition_success(mock_product):
     """Test create_nutrition function with valid data."""
     product_id = 1
-    create_nutrition(product_id, mock_product, mock_session)
+    rows = []
+    created_at = sqlite_timestamp(mock_product["created_t"])
+    updated_at = sqlite_timestamp(mock_product["last_modified_t"])
+    create_nutrition(product_id, mock_product, created_at, updated_at, rows)
 
-    mock_session.add.assert_called_once()
+    assert len(rows) == 1
 
-    added_nutrient = mock_session.add.call_args[0][0]
+    added_nutrient = rows[0]
 
-    assert added_nutrient.product_id == round(1, 2)
-    assert added_nutrient.energy_kcal_100g == round(539, 2)
-    assert added_nutrient.fat_100g == round(30.9, 2)
-    assert added_nutrient.saturated_fat_100g == round(10.6, 2)
-    assert added_nutrient.carbohydrates_100g == round(57.5, 2)
-    assert added_nutrient.sugars_100g == round(56.3, 2)
-    assert added_nutrient.proteins_100g == round(6.3, 2)
-    assert added_nutrient.salt_100g == round(0.107, 2)
-    assert added_nutrient.sodium_100g == round(0.0428, 2)
+    assert {
+        k: getattr(added_nutrient, k) for k in _EXPECTED_NUTRITION
+    } == _EXPECTED_NUTRITION
+    assert added_nutrient.created_at == _EXPECTED_CREATED_AT
 
 
-def test_create_categories_success(mock_product, mock_session):
-    """Test create_categories function with valid data."""
+def test_create_related_success(mock_product, mock_categories_count):
+    """Test create_related function with valid data."""
     product_id = 1
-    create_categories(product_id, mock_product, mock_session)
+    rows = RelatedRows([], [], [])
+    create_related(product_id, mock_product, "created", "updated", rows)
+
+    assert len(rows.ingredients) == len(mock_product["ingredients_tags"])
+    assert rows.ingredients[0].ingredient_text == "sugar"
+    assert len(rows.categories) == mock_categories_count
+    assert len(rows.countries) == 1
+
+
+def test_create_related_skips_unprefixed_tags():
+    """Test create_related skips tags without a language prefix."""
+    product = {
+        "ingredients_tags": ["en:palm-oil", "palm-oil"],
+        "countries_tags": ["france", "en:united-states"],
+    }
+    rows = RelatedRows([], [], [])
+    create_related(1, product, "created", "updated", rows)
+
+    assert [row.ingredient_text for row in rows.ingredients] == ["palm oil"]
+    assert [row.name for row in rows.countries] == ["United States"]
+
+
+@pytest.mark.parametrize(
+    "product,expected",
+    [
+        ({"packaging_text_en": "Glass jar, plastic lid"}, "Glass jar, plastic lid"),
+        ({"packaging_text": "pot en verre"}, "Pot en verre"),
+        ({"packaging_text_is": "glerkrukka"}, "Glerkrukka"),
+        ({"packaging_text_en_imported": "glass jar"}, "Glass jar"),
+        (None, ""),
+        ("not a dict", ""),
+    ],
+    ids=[
+        "english_text",
+        "generic_text",
+        "unlisted_language",
+        "suffixed_key",
+        "none_product",
+        "invalid_product",
+    ],
+)
+def test_get_packaging(product, expected):
+    """Test get_packaging function with various products."""
+    assert get_packaging(product) == expected
 
-    expected_count = len(mock_product["categories"].split(","))
 
-    assert mock_session.add.call_count == expected_count
+def test_create_product_success(mock_product):
+    """Test create_product function with valid data."""
+    existing_barcodes = set()
 
+    result = create_product(mock_product, existing_barcodes)
 
-def test_create_countries_success(mock_product, mock_session):
-    """Test create_countries function with valid data."""
-    product_id = 1
-    create_countries(product_id, mock_product, mock_session)
+    assert result is not None
+    assert result.barcode == mock_product["code"]
+    assert result.created_at == _EXPECTED_CREATED_AT
+    assert mock_product["code"] in existing_barcodes
 
-    mock_session.add.assert_called_once()
 
+def test_create_product_numeric_barcode(mock_product):
+    """Test create_product stores a numeric code as a stripped string."""
+    existing_barcodes = set()
 
-def test_get_packaging_with_english_text():
-    """Test get_packaging function with English packaging text."""
-    product_with_english_packaging = {"packaging_text_en": "Glass jar, plastic lid"}
-    result = get_packaging(product_with_english_packaging)
-    assert result == "Glass jar, plastic lid"
+    result = create_product({**mock_product, "code": 3017620422003}, existing_barcodes)
+    padded = create_product({**mock_product, "code": " 3017620422003 "}, set())
 
+    assert result.barcode == "3017620422003"
+    assert padded.barcode == "3017620422003"
+    assert "3017620422003" in existing_barcodes
 
-def test_get_packaging_with_generic_text():
-    """Test get_packaging function with generic packaging text."""
-    product_with_generic_packaging = {"packaging_text": "pot en verre"}
-    result = get_packaging(product_with_generic_packaging)
-    assert result == "Pot en verre"
 
+def test_create_product_duplicate_barcode(mock_product):
+    """Test create_product skips a barcode that is already stored."""
+    result = create_product(mock_product, {mock_product["code"]})
 
-def test_get_packaging_none_product():
-    """Test get_packaging function with None product."""
-    result = get_packaging(None)
-    assert result == ""
+    assert result is None
 
 
-def test_get_packaging_invalid_product():
-    """Test get_packaging function with invalid product type."""
-    result = get_packaging("not a dict")
-    assert result == ""
+def test_create_product_malformed_record_does_not_claim_barcode(mock_product):
+    """Test a record that fails to build leaves its barcode free for a later one."""
+    existing_barcodes = set()
 
+    with pytest.raises(TypeError):
+        create_product({**mock_product, "created_t": "abc"}, existing_barcodes)
 
-@patch("src.process.SessionLocal")
-@patch("src.process.Product")
-def test_create_product_success(
-    mock_product_class, mock_session_local, mock_product, mock_session
-):
-    """Test create_product function with valid data."""
-    mock_session.query().filter().first.return_value = None
+    assert mock_product["code"] not in existing_barcodes
+    assert create_product(mock_product, existing_barcodes) is not None
 
-    result = create_product(mock_product, mock_session)
 
-    assert result is True
-    mock_session.add.assert_called()
+def test_save_data_writes_and_skips_duplicates(
+    db_engine, mock_product, mock_categories_count
+):
+    """Test save_data stores each product once and shares lookup rows."""
+    products = [
+        {**mock_product, "code": "0001"},
+        {**mock_product, "code": "0002"},
+        {**mock_product, "code": "0002"},  # duplicate within the run
+    ]
+
+    save_data(iter(products), batch_size=2)
+
+    assert _fetch(db_engine, "SELECT barcode FROM products ORDER BY barcode") == [
+        ("0001",),
+        ("0002",),
+    ]
+    assert _fetch(db_engine, "SELECT COUNT(*) FROM nutrients") == [(2,)]
+    assert _fetch(db_engine, "SELECT COUNT(*) FROM ingredients") == [
+        (2 * len(mock_product["ingredients_tags"]),)
+    ]
+    # Lookup names are stored once and linked to both products
+    assert _fetch(db_engine, "SELECT COUNT(*) FROM categories") == [
+        (mock_categories_count,)
+    ]
+    assert _fetch(db_engine, "SELECT COUNT(*) FROM countries") == [(1,)]
+    assert _fetch(
+        db_engine,
+        "SELECT p.barcode, COUNT(*) FROM product_categories pc "
+        "JOIN products p ON p.id = pc.product_id GROUP BY p.barcode",
+    ) == [("0001", mock_categories_count), ("0002", mock_categories_count)]
+    country = capitalize_text(
+        normalize_text(split_text(mock_product["countries_tags"][0]))
+    )
+    assert _fetch(
+        db_engine,
+        "SELECT p.barcode, c.name FROM product_countries pc "
+        "JOIN products p ON p.id = pc.product_id "
+        "JOIN countries c ON c.id = pc.country_id ORDER BY p.barcode",
+    ) == [("0001", country), ("0002", country)]
+
+    # A rerun finds every barcode already stored and inserts nothing
+    tables = ("products", "nutrients", "ingredients", "product_categories")
+    before = [_fetch(db_engine, f"SELECT COUNT(*) FROM {t}") for t in tables]
+    save_data(iter(products), batch_size=2)
+    assert [_fetch(db_engine, f"SELECT COUNT(*) FROM {t}") for t in tables] == before
+
+
+def test_save_data_keeps_going_after_a_malformed_product(db_engine, mock_product):
+    """Test save_data logs a product with bad nutriments and saves the rest."""
+    products = [{**mock_product, "code": str(code)} for code in range(5)]
+    products[2] = {
+        **products[2],
+        "nutriments": {**mock_product["nutriments"], "fat_100g": ""},
+    }
+
+    save_data(iter(products))
+
+    assert _fetch(db_engine, "SELECT COUNT(*) FROM products") == [(5,)]
+    assert _fetch(
+        db_engine,
+        "SELECT p.barcode FROM products p "
+        "LEFT JOIN nutrients n ON n.product_id = p.id WHERE n.id IS NULL",
+    ) == [("2",)]
+    assert _fetch(db_engine, "SELECT COUNT(DISTINCT product_id) FROM ingredients") == [
+        (4,)
+    ]
+
+
+def test_save_data_interrupted_rolls_back_open_chunk(db_engine, mock_product):
+    """Test an interrupted load commits nothing from the unfinished chunk."""
+
+    def products():
+        for code in range(10):
+            yield {**mock_product, "code": str(code)}
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        save_data(products(), batch_size=5)
+
+    assert _fetch(db_engine, "SELECT COUNT(*) FROM products") == [(0,)]
+    # Child indexes are rebuilt even though the load was interrupted
+    assert ("ix_ingredients_product_id",) in _fetch(
+        db_engine, "SELECT name FROM sqlite_master WHERE type = 'index'"
+    )
+
+    # The rerun loads every product in full
+    save_data(iter([{**mock_product, "code": str(code)} for code in range(10)]))
+    assert _fetch(db_engine, "SELECT COUNT(DISTINCT product_id) FROM nutrients") == [
+        (10,)
+    ]
+
+
+def test_create_database_rejects_legacy_categories_table(db_engine):
+    """Test create_database refuses a database with per-product categories."""
+    with db_engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE product_categories")
+        conn.exec_driver_sql("DROP TABLE categories")
+        conn.exec_driver_sql(
+            "CREATE TABLE categories (id INTEGER PRIMARY KEY, "
+            "product_id INTEGER, category VARCHAR)"
+        )
+
+    with pytest.raises(RuntimeError, match="delete or migrate food_products.db"):
+        models.create_database()